@@ -0,0 +1,146 @@
+"""
+CS50’s Introduction to Programming with Python
+Final Project: `Mini Reader for The Hacker News website`
+
+Load test of the local read-only HTTP/JSON API server
+
+Usage:
+
+Start the server, then run the load test against it:
+    python project.py --serve
+    python load_test.py [-h] [--port PORT] [-c CONCURRENCY] [-n REQUESTS]
+                        [--revalidate] [path ...]
+"""
+
+import time
+import asyncio
+import argparse
+from statistics import quantiles
+
+# pip install tabulate
+from tabulate import tabulate
+
+from project import SERVER_HOST, SERVER_PORT
+
+
+async def client(host, port, paths, nb_requests, revalidate, results):
+    """send `nb_requests` requests over one keep-alive connection
+    :param paths: request targets, used in turn
+    :type paths: list
+    :param revalidate: send back the ETag received in `If-None-Match`
+    :type revalidate: bool
+    :param results: list where (status, latency in seconds, bytes read)
+    are appended
+    :type results: list
+    :return: None
+    :rtype: NoneType
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    try:
+        for i in range(nb_requests):
+            path = paths[i % len(paths)]
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+            if revalidate and path in etags:
+                request += f"If-None-Match: {etags[path]}\r\n"
+            start = time.perf_counter()
+            writer.write((request + "\r\n").encode())
+
+            # read the status line, the headers and the body, raise an
+            # IncompleteReadError if the server closes the connection
+            head = await reader.readuntil(b"\r\n\r\n")
+            status_line, *lines = head.decode("latin-1").split("\r\n")[:-2]
+            status = int(status_line.split()[1])
+            headers = {}
+            for line in lines:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            results.append((status, time.perf_counter() - start, len(body)))
+            etags[path] = headers.get("etag")
+    finally:
+        writer.close()
+
+
+async def run(host, port, paths, concurrency, nb_requests, revalidate):
+    """run `concurrency` clients sharing `nb_requests` requests
+    :return: results of the requests and total duration in seconds
+    :rtype: tuple
+    """
+    results = []
+    per_client = [nb_requests // concurrency] * concurrency
+    for i in range(nb_requests % concurrency):
+        per_client[i] += 1
+    start = time.perf_counter()
+    errors = await asyncio.gather(
+        *[
+            client(host, port, paths, n, revalidate, results)
+            for n in per_client
+            if n
+        ],
+        return_exceptions=True,
+    )
+    failed = sum(isinstance(error, Exception) for error in errors)
+    return results, failed, time.perf_counter() - start
+
+
+def report(results, failed, duration):
+    """summarize the load test results
+    :return: rows of (metric, value)
+    :rtype: list
+    """
+    # percentiles need at least 2 latencies
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    if len(latencies) >= 2:
+        percentiles = quantiles(latencies, n=100)
+        p50, p90, p99 = [f"{percentiles[i]:.2f}" for i in (49, 89, 98)]
+    else:
+        p50 = p90 = p99 = "-"
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return [
+        ["requests", len(results)],
+        ["duration (s)", f"{duration:.2f}"],
+        ["requests/s", f"{len(results) / duration:.0f}"],
+        ["latency p50 (ms)", p50],
+        ["latency p90 (ms)", p90],
+        ["latency p99 (ms)", p99],
+        ["bytes read", f"{sum(size for _, _, size in results)}"],
+        *[[f"status {s}", n] for s, n in sorted(statuses.items())],
+        ["failed connections", failed],
+    ]
+
+
+def main():
+    # set up the parser
+    parser = argparse.ArgumentParser(
+        description="load test of the `python project.py --serve` server"
+    )
+    parser.add_argument("paths", nargs="*", default=["/articles"])
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("-n", "--requests", type=int, default=5000)
+    parser.add_argument(
+        "--revalidate",
+        action="store_true",
+        help="send `If-None-Match` with the last ETag received",
+    )
+    args = parser.parse_args()
+
+    results, failed, duration = asyncio.run(
+        run(
+            SERVER_HOST,
+            args.port,
+            args.paths,
+            args.concurrency,
+            args.requests,
+            args.revalidate,
+        )
+    )
+    rows = report(results, failed, duration)
+    print(tabulate(rows, tablefmt="heavy_grid", disable_numparse=True))
+
+
+if __name__ == "__main__":
+    main()
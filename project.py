@@ -14,6 +14,11 @@ Display the latest article titles from `thehackernews.com` homepage
     python project.py -n
     python project.py --new
 
+Display only the homepage articles newer than the ones stored in the
+`the_haker_news.db` sqlite3 local database
+    python project.py -n -i
+    python project.py --new --incremental
+
 List the articles stored in the `the_haker_news.db` sqlite3 local database
     python project.py -l
     python project.py --list
@@ -27,13 +32,29 @@ Delete article(s) from the `the_haker_news.db` sqlite3 local database
     python project.py -d id [id ...]
     ython project.py --del id [id ...]
 where id is an article id number
+
+Serve the articles as paginated JSON on `http://127.0.0.1:PORT`
+(default port: 8050)
+    python project.py -s [PORT]
+    python project.py --serve [PORT]
 """
 
 import os
+import json
+import codecs
+import time
+import queue
+import asyncio
+import hashlib
 import sqlite3
 import requests
 import argparse
+import threading
 from datetime import datetime
+from collections import deque, OrderedDict
+from html.parser import HTMLParser
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs
 
 # pip install tabulate
 from tabulate import tabulate
@@ -45,6 +66,22 @@ from bs4 import BeautifulSoup
 HACKER_NEWS_URL = "https://thehackernews.com/"
 DB_PATH = os.path.join(os.getcwd(), "the_haker_news.db")
 
+# size of the chunks read by the incremental scrap of the homepage and
+# timeout in seconds of the homepage requests
+CHUNK_SIZE = 4096
+REQUEST_TIMEOUT = 10
+
+# settings of the local read-only HTTP/JSON API server (`-s --serve`)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8050
+POOL_SIZE = 4
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_PAGE = 100000
+CACHE_SIZE = 256
+SNAPSHOT_TTL = 300
+SNAPSHOT_REBUILD = 3600
+
 
 class Ansi:
     """class for Ansi color codes"""
@@ -56,6 +93,10 @@ class Ansi:
     reset = "\033[0m"
 
 
+class ScrapError(Exception):
+    """the download of `thehackernews.com` homepage failed"""
+
+
 def scrap_articles_and_urls():
     """scrap `thehackernews.com` homepage and get the articles titles,
     articles dates of publication, and articles url
@@ -68,7 +109,7 @@ def scrap_articles_and_urls():
 
     # get the home page html data and parse it with BeautifulSoup
     try:
-        data = requests.get(HACKER_NEWS_URL)
+        data = requests.get(HACKER_NEWS_URL, timeout=REQUEST_TIMEOUT)
     except:
         data = [{}]
     soup = BeautifulSoup(data.text, "html.parser")
@@ -91,16 +132,169 @@ def scrap_articles_and_urls():
     return articles_list
 
 
-def new_articles():
+class HomepageParser(HTMLParser):
+    """incremental parser of `thehackernews.com` homepage: each article is
+    appended to `articles` as soon as its `a.story-link` container closes,
+    and `stop` is set once an url of `known_urls` shows up
+    :param known_urls: urls of the articles already known
+    :type known_urls: set
+    """
+
+    def __init__(self, known_urls):
+        super().__init__()
+        self.known_urls = known_urls
+        self.articles = deque()
+        self.stop = False
+
+        # article being parsed, depth of its container, the tag whose text
+        # is being read and the depth of the nested tags with the same name
+        self.article = None
+        self.container = 0
+        self.field = None
+        self.depth = {"a": 0, "h2": 0, "div": 0}
+
+    def handle_starttag(self, tag, attrs):
+        if self.stop or tag not in self.depth:
+            return
+        self.depth[tag] += 1
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+
+        # new article container: stop if its url is already known
+        if tag == "a" and "story-link" in classes:
+            url = attrs.get("href") or ""
+            if url in self.known_urls:
+                self.stop = True
+                return
+            self.article = {"url": url, "title": "", "date": ""}
+            self.container = self.depth["a"]
+
+        # title and date of the current article
+        elif self.article is not None and self.field is None:
+            if tag == "h2" and "home-title" in classes:
+                self.field = ("title", tag, self.depth[tag])
+            elif tag == "div" and "item-label" in classes:
+                self.field = ("date", tag, self.depth[tag])
+
+    def handle_endtag(self, tag):
+        if self.stop or tag not in self.depth:
+            return
+
+        # end of the title or the date
+        if self.field is not None and self.field[1:] == (tag, self.depth[tag]):
+            self.field = None
+
+        # end of the article container
+        closes_container = tag == "a" and self.depth[tag] == self.container
+        if self.article is not None and closes_container:
+            self.articles.append(self.article)
+            self.article = None
+            self.field = None
+
+        self.depth[tag] = max(self.depth[tag] - 1, 0)
+
+    def handle_data(self, data):
+        if not self.stop and self.field is not None:
+            self.article[self.field[0]] += data
+
+
+def scrap_new_articles(known_urls):
+    """incremental scrap of `thehackernews.com` homepage: stream the page and
+    yield the articles one by one, newest first, until an article whose url
+    is in `known_urls` (e.g. the urls of the `articles` table or of the last
+    homepage scrap) shows up. The rest of the page is neither downloaded
+    nor parsed.
+    :param known_urls: urls of the articles already known
+    :type known_urls: set
+    :raise ScrapError: if the download fails, before or during the stream
+    :return: generator of dict. Each dict contains title, date, url and id
+    number for one article
+    :rtype: generator
+    """
+    # stream the home page html data
+    try:
+        data = requests.get(HACKER_NEWS_URL, stream=True, timeout=REQUEST_TIMEOUT)
+        data.raise_for_status()
+    except requests.RequestException as e:
+        raise ScrapError(e) from e
+
+    parser = HomepageParser(known_urls)
+    # unknown charset in the response headers: fall back to utf-8
+    try:
+        decoder = codecs.getincrementaldecoder(data.encoding or "utf-8")("replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    id = 0
+    try:
+        # feed the parser chunk by chunk and yield the complete articles
+        for chunk in data.iter_content(chunk_size=CHUNK_SIZE):
+            parser.feed(decoder.decode(chunk))
+            while parser.articles:
+                article = parser.articles.popleft()
+                date = article["date"].split("\ue804")[0].replace("\ue802", "")
+                id += 1
+                yield {
+                    "id": id,
+                    "date": date,
+                    "title": article["title"],
+                    "url": article["url"],
+                }
+            if parser.stop:
+                break
+    except requests.RequestException as e:
+        raise ScrapError(e) from e
+    finally:
+        # stop the download
+        data.close()
+
+
+def stored_urls(conn):
+    """get the urls of the articles stored in `articles` table of
+    `the_haker_news.db` sqlite3 database
+    :param conn: Connection object of `the_haker_news.db` sqlite3 database
+    :type conn: sqlite3.Connection
+    :return: urls of the stored articles
+    :rtype: set
+    """
+    return {url for (url,) in conn.execute("""SELECT url FROM articles;""")}
+
+
+def new_articles(conn=None):
     """display the latest articles from `thehackernews.com` homepage
+    :param conn: Connection object of `the_haker_news.db` sqlite3 database.
+    If set, incremental mode: only the articles newer than the stored ones
+    are displayed, the homepage is scraped until a stored article shows up
+    :type conn: sqlite3.Connection
     :return: None
     :rtype: NoneType
     """
     # get the latest articles data from `thehackernews.com` homepage
-    homepage_articles = scrap_articles_and_urls()
+    if conn is None:
+        homepage_articles = scrap_articles_and_urls()
+    else:
+        try:
+            homepage_articles = list(scrap_new_articles(stored_urls(conn)))
+
+        # if the download failed, print a message and return
+        except ScrapError as e:
+            print(
+                Ansi.red
+                + f"\nCan't download `thehackernews.com` homepage: {e}\n"
+                + Ansi.reset
+            )
+            return
+
+    # if no new article stored, print a message
+    if len(homepage_articles) == 0 and conn is not None:
+        print(
+            Ansi.orange
+            + "\nNo article newer than the ones stored in `the_haker_news.db`"
+            + " database\n"
+            + Ansi.reset
+        )
 
     # if no article found on `thehackernews.com` homepage, print a message
-    if len(homepage_articles) == 0:
+    elif len(homepage_articles) == 0:
         print(Ansi.red
               + "`thehackernews.com` homepage doesn't contain article."
               + Ansi.reset)
@@ -352,6 +546,387 @@ def del_article(article_ids, conn):
         print(Ansi.orange + f"No article has been deleted.\n" + Ansi.reset)
 
 
+class ConnectionPool:
+    """pool of warm connections to the `the_haker_news.db` sqlite3 database,
+    shared by the threads of the API server
+    :param db_path: path of the sqlite3 database
+    :type db_path: str
+    :param size: number of connections kept open
+    :type size: int
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(
+                db_path,
+                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                check_same_thread=False,
+            )
+            self.connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """borrow a connection from the pool, wait if all are in use
+        :return: Connection object of the sqlite3 database
+        :rtype: sqlite3.Connection
+        """
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self):
+        """close all the connections of the pool
+        :return: None
+        :rtype: NoneType
+        """
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class ArticleServer:
+    """local read-only HTTP/JSON API over the `articles` table of
+    `the_haker_news.db` sqlite3 database
+
+    Routes (GET or HEAD only):
+        /articles?page=1&per_page=20    stored articles
+        /search?q=word&page=1           stored articles whose title contains `q`
+        /new                            latest `thehackernews.com` homepage snapshot
+
+    The query results requested more than once are cached in memory (the
+    `CACHE_SIZE` most recently used ones) until `PRAGMA data_version`
+    reports a change committed to the database by another connection.
+    Each response has an ETag, `If-None-Match` gets a `304 Not Modified`.
+
+    :param db_path: path of the sqlite3 database
+    :type db_path: str
+    :param pool_size: number of warm sqlite3 connections
+    :type pool_size: int
+    """
+
+    def __init__(self, db_path=DB_PATH, pool_size=POOL_SIZE):
+        self.pool = ConnectionPool(db_path, pool_size)
+
+        # dedicated connection to watch `data_version`: its values are
+        # only comparable when read from the same connection
+        self.watcher = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.version = None
+        self.cache = OrderedDict()
+
+        # keys requested once: a result is cached at its second request
+        self.seen = OrderedDict()
+
+        # latest homepage snapshot: (time of the last scrap, time of the
+        # last full scrap, articles, etag, body), None before the first scrap
+        self.snapshot_lock = threading.Lock()
+        self.snapshot = None
+
+    def close(self):
+        """close the database connections
+        :return: None
+        :rtype: NoneType
+        """
+        self.pool.close()
+        self.watcher.close()
+
+    def query_articles(self, page, per_page, search=None):
+        """get one page of the articles stored in the `articles` table
+        :param page: page number, starting from 1
+        :type page: int
+        :param per_page: number of articles per page
+        :type per_page: int
+        :param search: text to look for in the articles titles
+        :type search: str
+        :return: page, per_page, total number of articles and articles list
+        :rtype: dict
+        """
+        # build the sql requests
+        where, values = "", []
+        if search:
+            # `%`, `_` and `\` of the search are not wildcards
+            for char in "\\%_":
+                search = search.replace(char, "\\" + char)
+            where, values = " WHERE title LIKE ? ESCAPE '\\'", [f"%{search}%"]
+        sql_count = f"SELECT COUNT(*) FROM articles{where};"
+        sql = f"SELECT * FROM articles{where} ORDER BY id LIMIT ? OFFSET ?;"
+
+        # execute the requests with a connection from the pool
+        with self.pool.connection() as conn:
+            total = conn.execute(sql_count, values).fetchone()[0]
+            rows = conn.execute(
+                sql, values + [per_page, (page - 1) * per_page]
+            ).fetchall()
+
+        return {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "articles": [
+                {
+                    "id": row[0],
+                    "date": row[1].strftime("%B %d, %Y"),
+                    "title": row[2],
+                    "url": row[3],
+                }
+                for row in rows
+            ],
+        }
+
+    def cached_articles(self, page, per_page, search=None):
+        """same as `query_articles` but cached until the database changes
+        :return: etag and json body of the response
+        :rtype: tuple
+        """
+        key = (page, per_page, search)
+
+        # drop the whole cache if the database has changed
+        with self.lock:
+            version = self.watcher.execute("PRAGMA data_version;").fetchone()[0]
+            if version != self.version:
+                self.cache.clear()
+                self.seen.clear()
+                self.version = version
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        # not in cache: execute the requests, store the result if it has
+        # already been requested, and drop the least recently used ones
+        response = to_response(self.query_articles(page, per_page, search))
+        with self.lock:
+            if self.version == version:
+                if key in self.seen:
+                    del self.seen[key]
+                    self.cache[key] = response
+                    if len(self.cache) > CACHE_SIZE:
+                        self.cache.popitem(last=False)
+                else:
+                    self.seen[key] = None
+                    if len(self.seen) > CACHE_SIZE:
+                        self.seen.popitem(last=False)
+        return response
+
+    def homepage_snapshot(self):
+        """latest articles from `thehackernews.com` homepage, scraped again
+        once the snapshot is older than `SNAPSHOT_TTL` seconds. Only the
+        articles newer than the ones of the last snapshot are scraped, the
+        whole homepage is scraped again every `SNAPSHOT_REBUILD` seconds so
+        that the articles moved or removed from the homepage are updated.
+        While one request refreshes the snapshot, the other ones get the
+        stale snapshot instead of waiting. If the scrap fails, the previous
+        snapshot is kept.
+        :return: status, etag and json body of the response
+        :rtype: tuple
+        """
+        snapshot = self.snapshot
+        now = time.monotonic()
+        stale = snapshot is None or now - snapshot[0] > SNAPSHOT_TTL
+        if stale and self.snapshot_lock.acquire(blocking=False):
+            try:
+                rebuild = snapshot is None or now - snapshot[1] > SNAPSHOT_REBUILD
+                articles = [] if rebuild else snapshot[2]
+                rebuilt_at = now if rebuild else snapshot[1]
+
+                # put the new articles on top, the homepage keeps its length
+                new = list(scrap_new_articles({a["url"] for a in articles}))
+                articles = (new + articles)[: max(len(new), len(articles))]
+                articles = [
+                    {**article, "id": id + 1} for id, article in enumerate(articles)
+                ]
+                response = to_response({"articles": articles})
+                self.snapshot = (now, rebuilt_at, articles, *response)
+            except ScrapError:
+                pass
+            finally:
+                self.snapshot_lock.release()
+
+        # no snapshot yet: the first scrap failed or is still running
+        if self.snapshot is None:
+            error = "`thehackernews.com` homepage not available"
+            return (503, *to_response({"error": error}))
+        return (200, *self.snapshot[3:])
+
+    def route(self, target):
+        """get the response of a request target such as `/articles?page=2`
+        :param target: path and query string of the request
+        :type target: str
+        :return: status, etag and json body of the response
+        :rtype: tuple
+        """
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/new":
+            return self.homepage_snapshot()
+
+        if url.path not in ("/articles", "/search"):
+            return (404, *to_response({"error": "not found"}))
+
+        # check the pagination parameters
+        try:
+            page = int(params.get("page", 1))
+            per_page = int(params.get("per_page", PAGE_SIZE))
+        except ValueError:
+            page = per_page = 0
+        if not 1 <= page <= MAX_PAGE or not 1 <= per_page <= MAX_PAGE_SIZE:
+            error = (
+                f"page must be between 1 and {MAX_PAGE} "
+                f"and per_page between 1 and {MAX_PAGE_SIZE}"
+            )
+            return (400, *to_response({"error": error}))
+
+        # `/search` needs a `q` parameter
+        search = None
+        if url.path == "/search":
+            search = params.get("q", "").strip()
+            if not search:
+                return (400, *to_response({"error": "missing `q` parameter"}))
+
+        return (200, *self.cached_articles(page, per_page, search))
+
+    async def handle(self, reader, writer):
+        """serve the HTTP/1.1 requests of one client connection
+        :param reader: stream to read the requests from
+        :type reader: asyncio.StreamReader
+        :param writer: stream to write the responses to
+        :type writer: asyncio.StreamWriter
+        :return: None
+        :rtype: NoneType
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # read the request line and the headers, a line longer than
+                # the stream limit raises a ValueError
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    error = to_response({"error": "bad request"})
+                    writer.write(build_response(400, *error))
+                    await writer.drain()
+                    break
+
+                # the database and the scrap are blocking: run them in a thread
+                if method not in ("GET", "HEAD"):
+                    error = to_response({"error": "method not allowed"})
+                    status, etag, body = (405, *error)
+                else:
+                    try:
+                        status, etag, body = await loop.run_in_executor(
+                            None, self.route, target
+                        )
+                    except Exception:
+                        error = to_response({"error": "internal server error"})
+                        status, etag, body = (500, *error)
+
+                # revalidation: the client already has this version
+                if_none_match = headers.get("if-none-match", "").split(",")
+                if status == 200 and etag in [e.strip() for e in if_none_match]:
+                    status, body = 304, b""
+
+                # request bodies are not read: close after any other method
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and version == "HTTP/1.1"
+                    and method in ("GET", "HEAD")
+                )
+                response = build_response(
+                    status, etag, body, keep_alive, head_only=method == "HEAD"
+                )
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+        """start the server and serve until cancelled
+        :return: None
+        :rtype: NoneType
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def to_response(data):
+    """serialize data to a json body and compute its ETag
+    :param data: data to be sent
+    :type data: dict
+    :return: etag and json body
+    :rtype: tuple
+    """
+    body = json.dumps(data, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    return etag, body
+
+
+def build_response(status, etag, body, keep_alive=False, head_only=False):
+    """build the bytes of an HTTP/1.1 response
+    :param head_only: response to a HEAD request: same headers, no body
+    :type head_only: bool
+    :return: HTTP response
+    :rtype: bytes
+    """
+    reasons = {
+        200: "OK",
+        304: "Not Modified",
+        400: "Bad Request",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        500: "Internal Server Error",
+        503: "Service Unavailable",
+    }
+    headers = [
+        f"HTTP/1.1 {status} {reasons[status]}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"ETag: {etag}",
+        "Cache-Control: no-cache",
+        "Connection: " + ("keep-alive" if keep_alive else "close"),
+    ]
+    head = ("\r\n".join(headers) + "\r\n\r\n").encode()
+    return head if head_only else head + body
+
+
+def serve(port=SERVER_PORT):
+    """serve the `the_haker_news.db` articles as paginated JSON on localhost
+    :param port: port of the server
+    :type port: int
+    :return: None
+    :rtype: NoneType
+    """
+    server = ArticleServer(DB_PATH)
+    print(
+        Ansi.orange
+        + f"\nServing `the_haker_news.db` on http://{SERVER_HOST}:{port} "
+        + "(press CTRL+C to quit)\n"
+        + Ansi.reset
+    )
+    try:
+        asyncio.run(server.serve(SERVER_HOST, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
 def main():
     # connect to the `the_haker_News` sqlite3 database
     try:
@@ -382,6 +957,15 @@ def main():
         help="display the article titles from `thehackernews.com` homepage",
     )
 
+    # set up `-i --incremental` argument: with `-n --new`, only display the
+    # articles newer than the ones stored in `the_haker_news.db` database
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="with -n, only display the articles newer than the stored ones",
+    )
+
     # set up `-l --list` argument: display the articles stored in the `articles`
     # table of `the_haker_news.db` sqlite3 database
     group.add_argument(
@@ -411,12 +995,29 @@ def main():
         help="delete article(s) from the `the_haker_news.db` database",
     )
 
+    # set up `-s --serve` argument: serve the articles stored in the `articles`
+    # table of `the_haker_news.db` sqlite3 database as paginated JSON
+    group.add_argument(
+        "-s",
+        "--serve",
+        type=int,
+        nargs="?",
+        const=SERVER_PORT,
+        metavar="PORT",
+        help="serve the `the_haker_news.db` articles as JSON on localhost",
+    )
+
     # parse the command line into a dict
     args = vars(parser.parse_args())
 
-    # command line is `-n --new`
+    # `-i --incremental` only works with `-n --new`
+    if args["incremental"] and not args["new"]:
+        parser.error("argument -i/--incremental: requires -n/--new")
+
+    # command line is `-n --new`, with `-i --incremental` only the articles
+    # newer than the stored ones are scraped
     if args["new"]:
-        new_articles()
+        new_articles(conn if args["incremental"] else None)
 
     # command line id `-l --list`
     elif args["list"]:
@@ -432,6 +1033,10 @@ def main():
         article_ids = args["del"]
         del_article(article_ids, conn)
 
+    # command line is `-s --serve`
+    elif args["serve"] is not None:
+        serve(args["serve"])
+
 
 if __name__ == "__main__":
     main()
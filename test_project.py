@@ -6,15 +6,22 @@ Test Functions with Pytest
 """
 
 import os
+import json
 import pytest
+import asyncio
+import requests
 import sqlite3
 from datetime import datetime
 from unittest.mock import patch
 from project import scrap_articles_and_urls
+from project import scrap_new_articles
+from project import ScrapError
 from project import new_articles
 from project import list_articles
 from project import add_article
 from project import del_article
+from project import ArticleServer
+from project import SNAPSHOT_TTL
 
 
 TEST_DATA = [
@@ -26,6 +33,43 @@ TEST_DATA = [
 ]
 
 
+class FakeStreamedHomepage:
+    """fake streamed response of `thehackernews.com` homepage built from
+    TEST_DATA, read by chunks of one article"""
+
+    def __init__(self, *args, **kwargs):
+        self.encoding = "utf-8"
+        self.chunks_read = 0
+        self.closed = False
+        self.chunks = [b"<html><body><div class='blog-posts'>"]
+        for article in TEST_DATA:
+            self.chunks.append(
+                (
+                    f"<div class='body-post clear'>"
+                    f"<a class='story-link' href='{article['url']}'>"
+                    f"<div class='clear home-post-box cf'>"
+                    f"<h2 class='home-title'>{article['title']}</h2>"
+                    f"<div class='item-label'><span class='h-datetime'>"
+                    f"<i class='icon-font icon-calendar'>\ue802</i>"
+                    f"{article['date']}</span><span class='h-tags'>"
+                    f"<i class='icon-font icon-user'>\ue804</i>author</span>"
+                    f"</div></div></a></div>"
+                ).encode()
+            )
+        self.chunks.append(b"</div></body></html>")
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            self.chunks_read += 1
+            yield chunk
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
 @pytest.fixture
 def generate_test_data_base():
     def create():
@@ -90,6 +134,92 @@ def test_scrap_articles_and_urls_each_dict_url_has_html_extension():
     assert all(n["url"][-5:] == ".html" for n in articles_list)
 
 
+@patch("project.requests.get", FakeStreamedHomepage)
+def test_scrap_new_articles_nothing_known():
+    articles_list = list(scrap_new_articles(set()))
+    assert articles_list == TEST_DATA
+
+
+def test_scrap_new_articles_stop_at_known_url():
+    response = FakeStreamedHomepage()
+    with patch("project.requests.get", lambda *args, **kwargs: response):
+        articles_list = list(scrap_new_articles({TEST_DATA[2]["url"]}))
+
+    # only the articles before the known one, the download is stopped there
+    assert (
+        articles_list == TEST_DATA[:2]
+        and response.chunks_read == 4
+        and response.closed
+    )
+
+
+def test_scrap_new_articles_yield_before_download_ends():
+    response = FakeStreamedHomepage()
+    with patch("project.requests.get", lambda *args, **kwargs: response):
+        first_article = next(scrap_new_articles(set()))
+    assert first_article == TEST_DATA[0] and response.chunks_read == 2
+
+
+def test_scrap_new_articles_unknown_charset():
+    response = FakeStreamedHomepage()
+    response.encoding = "not-a-charset"
+    with patch("project.requests.get", lambda *args, **kwargs: response):
+        articles_list = list(scrap_new_articles(set()))
+    assert articles_list == TEST_DATA
+
+
+def test_new_articles_incremental_stop_at_stored_article(
+    generate_test_data_base, delete_test_data_base, capsys
+):
+    # store the third article of the homepage
+    conn = generate_test_data_base()
+    date = datetime.strptime(TEST_DATA[2]["date"], "%B %d, %Y")
+    values = [date, TEST_DATA[2]["title"], TEST_DATA[2]["url"]]
+    conn.execute("INSERT INTO articles (date, title, url) VALUES (?, ?, ?);", values)
+    conn.commit()
+
+    response = FakeStreamedHomepage()
+    with patch("project.requests.get", lambda *args, **kwargs: response):
+        new_articles(conn)
+    output = capsys.readouterr().out
+
+    # only the 2 newer articles are displayed, the download stops there
+    assert (
+        "test1" in output
+        and "test2" in output
+        and "test3" not in output
+        and response.chunks_read == 4
+        and response.closed
+    )
+    delete_test_data_base()  # delete test database
+
+
+def test_new_articles_incremental_failed_request(
+    generate_test_data_base, delete_test_data_base, capsys
+):
+    conn = generate_test_data_base()
+    with patch("project.requests.get", side_effect=requests.ConnectionError):
+        new_articles(conn)
+    output = capsys.readouterr().out
+    assert "Can't download" in output and "No article newer" not in output
+    delete_test_data_base()  # delete test database
+
+
+def test_scrap_new_articles_error_during_download():
+    response = FakeStreamedHomepage()
+
+    # the connection breaks after the first article
+    def iter_content(chunk_size=1):
+        yield from response.chunks[:2]
+        raise requests.exceptions.ChunkedEncodingError
+
+    response.iter_content = iter_content
+    with patch("project.requests.get", lambda *args, **kwargs: response):
+        with pytest.raises(ScrapError):
+            list(scrap_new_articles(set()))
+    assert response.closed
+
+
 def test_new_articles_return_none():
     assert new_articles() == None
 
@@ -255,3 +385,198 @@ def test_del_article_check_reseted_id(generate_test_data_base, delete_test_data_
     check = [row[0] for row in data]
     assert check == list(range(1, len(check) + 1))
     delete_test_data_base()  # delete test database
+
+
+@pytest.fixture
+def server(generate_test_data_base, delete_test_data_base):
+    # create the test database and an API server over it
+    generate_test_data_base().close()
+    server = ArticleServer(os.path.join(os.getcwd(), "the_haker_news_test.db"))
+    yield server
+    # close the server and delete test database
+    server.close()
+    delete_test_data_base()
+
+
+def fill_test_data_base(conn):
+    # add all the test data articles in the test database
+    cursor = conn.cursor()
+    for article in TEST_DATA:
+        date = datetime.strptime(article["date"], "%B %d, %Y")
+        columns = "date, title, url"
+        values = [date, article["title"], article["url"]]
+        sql = f"INSERT INTO articles ({columns}) VALUES (?, ?, ?);"
+        cursor.execute(sql, values)
+        conn.commit()
+
+
+def get(server, request):
+    # send a raw HTTP request to the server, return status, headers and body
+    async def send():
+        tcp_server = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = tcp_server.sockets[0].getsockname()[1]
+        async with tcp_server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request.encode())
+            response = await reader.read()
+            writer.close()
+        return response
+
+    head, _, body = asyncio.run(send()).partition(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def test_server_articles_paginated(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+    status, _, body = get(server, "GET /articles?page=2&per_page=2 HTTP/1.0\r\n\r\n")
+    data = json.loads(body)
+    assert (
+        status == 200
+        and data["total"] == len(TEST_DATA)
+        and [a["title"] for a in data["articles"]] == ["test3", "test4"]
+    )
+
+
+def test_server_search(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+    status, _, body = get(server, "GET /search?q=test5 HTTP/1.0\r\n\r\n")
+    data = json.loads(body)
+    assert status == 200 and [a["url"] for a in data["articles"]] == ["test5.html"]
+
+
+def test_server_bad_pagination(server):
+    status, _, _ = get(server, "GET /articles?page=0 HTTP/1.0\r\n\r\n")
+    assert status == 400
+
+
+def test_server_page_too_large(server):
+    request = "GET /articles?page=99999999999999999999 HTTP/1.0\r\n\r\n"
+    status, _, _ = get(server, request)
+    assert status == 400
+
+
+def test_server_internal_error(server):
+    with patch.object(server, "query_articles", side_effect=sqlite3.Error):
+        status, _, body = get(server, "GET /articles HTTP/1.0\r\n\r\n")
+    assert status == 500 and "error" in json.loads(body)
+
+
+def test_server_search_wildcards(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+    totals = []
+    for q in ("%25", "_", "test_"):
+        _, _, body = get(server, f"GET /search?q={q} HTTP/1.0\r\n\r\n")
+        totals.append(json.loads(body)["total"])
+    assert totals == [0, 0, 0]
+
+
+@patch("project.CACHE_SIZE", 2)
+def test_server_cache_bounded(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+
+    # a result is cached at its second request, only the 2 most recent ones
+    for page in (1, 1, 2, 2, 3, 3, 4):
+        server.cached_articles(page, 1)
+    assert list(server.cache) == [(2, 1, None), (3, 1, None)]
+
+
+def test_server_head(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+    _, get_headers, get_body = get(server, "GET /articles HTTP/1.0\r\n\r\n")
+    status, headers, body = get(server, "HEAD /articles HTTP/1.0\r\n\r\n")
+
+    # same headers as GET, without the body
+    assert (
+        status == 200
+        and body == b""
+        and headers["Content-Length"] == str(len(get_body))
+        and headers["ETag"] == get_headers["ETag"]
+    )
+
+
+def test_server_etag_revalidation(server, generate_test_data_base):
+    conn = generate_test_data_base()
+    fill_test_data_base(conn)
+    _, headers, _ = get(server, "GET /articles HTTP/1.0\r\n\r\n")
+    etag = headers["ETag"]
+
+    # same data: `304 Not Modified` without body
+    request = f"GET /articles HTTP/1.0\r\nIf-None-Match: {etag}\r\n\r\n"
+    status, _, body = get(server, request)
+    assert status == 304 and body == b""
+
+    # the database changes: the cache is invalidated and the ETag changes
+    conn.execute("DELETE FROM articles WHERE id = 1;")
+    conn.commit()
+    status, headers, body = get(server, request)
+    assert (
+        status == 200
+        and headers["ETag"] != etag
+        and json.loads(body)["total"] == len(TEST_DATA) - 1
+    )
+
+
+@patch("project.SNAPSHOT_TTL", -1)
+def test_server_homepage_snapshot_incremental(server):
+    with patch("project.requests.get", FakeStreamedHomepage):
+        server.homepage_snapshot()
+
+    # one new article on top of the homepage: the oldest one is dropped
+    new = {"id": 1, "date": "January 02, 2022", "title": "new", "url": "new.html"}
+    with patch("project.scrap_new_articles", lambda known_urls: iter([new])):
+        _, _, body = server.homepage_snapshot()
+    articles = json.loads(body)["articles"]
+    assert (
+        [a["title"] for a in articles] == ["new", "test1", "test2", "test3", "test4"]
+        and [a["id"] for a in articles] == [1, 2, 3, 4, 5]
+    )
+
+
+def test_server_homepage_snapshot_stale_during_refresh(server):
+    with patch("project.requests.get", FakeStreamedHomepage):
+        stale = server.homepage_snapshot()
+
+    # another request is refreshing the snapshot: no scrap, no wait
+    server.snapshot = (-SNAPSHOT_TTL - 1, *server.snapshot[1:])
+    server.snapshot_lock.acquire()
+    with patch("project.scrap_new_articles", side_effect=AssertionError):
+        response = server.homepage_snapshot()
+    server.snapshot_lock.release()
+    assert response == stale
+
+
+def test_server_homepage_snapshot_first_scrap_failed(server):
+    with patch("project.requests.get", side_effect=requests.ConnectionError):
+        status, _, _ = server.homepage_snapshot()
+
+    # no snapshot to serve, nothing cached
+    assert status == 503 and server.snapshot is None
+
+
+@patch("project.SNAPSHOT_TTL", -1)
+def test_server_homepage_snapshot_refresh_failed(server):
+    with patch("project.requests.get", FakeStreamedHomepage):
+        previous = server.homepage_snapshot()
+    with patch("project.scrap_new_articles", side_effect=ScrapError):
+        response = server.homepage_snapshot()
+    assert response == previous and response[0] == 200
+
+
+@patch("project.SNAPSHOT_TTL", -1)
+@patch("project.SNAPSHOT_REBUILD", -1)
+def test_server_homepage_snapshot_rebuild(server):
+    with patch("project.requests.get", FakeStreamedHomepage):
+        server.homepage_snapshot()
+
+    # full scrap: the articles removed from the homepage are dropped
+    new = {"id": 1, "date": "January 02, 2022", "title": "new", "url": "new.html"}
+    with patch("project.scrap_new_articles", lambda known_urls: iter([new])):
+        _, _, body = server.homepage_snapshot()
+    assert [a["title"] for a in json.loads(body)["articles"]] == ["new"]